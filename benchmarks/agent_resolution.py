@@ -0,0 +1,86 @@
+"""
+Time agent resolution (teams and instance ids) on synthetic logs and check
+the columnar resolver against the per-event loops it replaced:
+
+    python -m benchmarks.agent_resolution --events 20000 1000000
+"""
+import argparse
+import logging
+import time
+from typing import Dict, List
+
+import gw2_data
+import parser
+import query
+import watchdog_fightCount as fight_watchdog
+from benchmarks.synthetic_log import build_log
+
+logger = logging.getLogger(__name__)
+
+
+def loop_team_changes(agents: List, events: List) -> None:
+    """Per-event team resolution as it was before the columnar resolver."""
+    team_assignments: Dict[int, int] = {}
+    for event in events:
+        if event.is_statechange == 22 and event.src_agent:
+            assigned_team = event.dst_agent if event.dst_agent else event.value
+            if assigned_team != 0:
+                team_assignments[event.src_agent] = assigned_team
+
+    for agent in agents:
+        if agent.is_elite != 4294967295 and not agent.team:
+            assigned_team = team_assignments.get(agent.address)
+            if assigned_team in gw2_data.team_ids:
+                agent.team = gw2_data.team_ids[assigned_team]
+
+
+def loop_agent_instance_id(agents: List, events: List) -> None:
+    """Per-event instance id resolution as it was before the columnar resolver."""
+    instance_ids: Dict[int, int] = {}
+    for event in events:
+        if event.is_statechange != 22 and event.src_instid and event.src_agent:
+            if event.src_agent not in instance_ids:
+                instance_ids[event.src_agent] = event.src_instid
+
+    for agent in agents:
+        if agent.is_elite != 4294967295 and not agent.instid:
+            instid = instance_ids.get(agent.address)
+            if instid:
+                agent.instid = instid
+
+
+def run(event_count: int) -> None:
+    data = build_log(event_count)
+
+    start = time.perf_counter()
+    _, loop_agents, _, events = parser.parse_evtc_bytes(data)
+    parsed = time.perf_counter()
+    loop_team_changes(loop_agents, events)
+    loop_agent_instance_id(loop_agents, events)
+    loop_summary = fight_watchdog.summarize_non_squad_players(loop_agents)
+    loop_end = time.perf_counter()
+
+    start_columns = time.perf_counter()
+    _, agents, _, raw_events = parser.parse_evtc_bytes(data, raw_events=True)
+    table = query.EventTable.from_records(raw_events)
+    parsed_columns = time.perf_counter()
+    summary = fight_watchdog.summarize_log(agents, table)
+    end = time.perf_counter()
+
+    assert [(a.address, a.team, a.instid) for a in agents] == [(a.address, a.team, a.instid) for a in loop_agents]
+    assert summary == loop_summary
+    logger.info(
+        "%d events: loops parse %.0f ms + resolve %.1f ms, columns parse %.0f ms + resolve %.1f ms; results identical",
+        len(table),
+        (parsed - start) * 1000, (loop_end - parsed) * 1000,
+        (parsed_columns - start_columns) * 1000, (end - parsed_columns) * 1000,
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    logging.getLogger(fight_watchdog.__name__).setLevel(logging.WARNING)
+    arg_parser = argparse.ArgumentParser(description="Benchmark agent resolution against the per-event loops")
+    arg_parser.add_argument("--events", type=int, nargs="+", default=[20000, 1000000])
+    for event_count in arg_parser.parse_args().events:
+        run(event_count)
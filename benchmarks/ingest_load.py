@@ -0,0 +1,88 @@
+"""
+Start an IngestServer in-process and check it under concurrent uploads:
+
+    python -m benchmarks.ingest_load --clients 50
+"""
+import argparse
+import asyncio
+import io
+import logging
+import time
+import zipfile
+
+import ingest_server
+from benchmarks.synthetic_log import build_log
+
+logger = logging.getLogger(__name__)
+
+
+def zip_log(data: bytes) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zip_ref:
+        zip_ref.writestr("upload.evtc", data)
+    return buffer.getvalue()
+
+
+async def send_raw(port: int, request: bytes) -> int:
+    reader, writer = await asyncio.open_connection(ingest_server.DEFAULT_HOST, port)
+    writer.write(request)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    return int(response.split(b" ", 2)[1])
+
+
+async def run(clients: int, event_count: int) -> None:
+    log = zip_log(build_log(event_count))
+    server = ingest_server.IngestServer(
+        webhook_url=None, port=0, max_upload_bytes=4 * len(log) + 1024 * 1024, read_timeout=2,
+    )
+    await server.start()
+    host, port = ingest_server.DEFAULT_HOST, server.port
+    try:
+        start = time.perf_counter()
+        results = await asyncio.gather(
+            *(ingest_server.upload_log(host, port, f"fight{i}.zevtc", log) for i in range(clients))
+        )
+        elapsed = time.perf_counter() - start
+        statuses = [status for status, _ in results]
+        assert statuses == [200] * clients, statuses
+        assert all(body["events"] == results[0][1]["events"] for _, body in results)
+        logger.info("%d concurrent uploads of %d bytes: all 200 in %.2fs", clients, len(log), elapsed)
+
+        # Rejections the client must actually receive
+        bomb = zip_log(bytes(server.max_upload_bytes + 1))
+        assert (await ingest_server.upload_log(host, port, "bomb.zevtc", bomb))[0] == 422
+        assert (await ingest_server.upload_log(host, port, "empty.zevtc", _empty_zip()))[0] == 422
+        too_big = bytes(server.max_upload_bytes + 1)
+        assert (await ingest_server.upload_log(host, port, "big.evtc", too_big))[0] == 413
+        assert await send_raw(port, b"POST /a.evtc HTTP/1.1\r\nContent-Length: abc\r\n\r\n") == 400
+
+        # Clients that stall mid-body fill every buffer slot, then time out
+        idle = [await asyncio.open_connection(host, port) for _ in range(server.max_buffered)]
+        for _, writer in idle:
+            writer.write(b"POST /idle.evtc HTTP/1.1\r\nContent-Length: 100\r\n\r\nxx")
+        status, _ = await asyncio.wait_for(
+            ingest_server.upload_log(host, port, "after_idle.zevtc", log), 3 * server.read_timeout
+        )
+        assert status == 200, status
+        for _, writer in idle:
+            writer.close()
+        logger.info("Rejections and idle-client checks passed")
+    finally:
+        await server.stop()
+
+
+def _empty_zip() -> bytes:
+    buffer = io.BytesIO()
+    zipfile.ZipFile(buffer, "w").close()
+    return buffer.getvalue()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    arg_parser = argparse.ArgumentParser(description="Concurrent upload check for an in-process ingest server")
+    arg_parser.add_argument("--clients", type=int, default=50)
+    arg_parser.add_argument("--events", type=int, default=20000, help="events per synthetic log")
+    args = arg_parser.parse_args()
+    asyncio.run(run(args.clients, args.events))
@@ -0,0 +1,120 @@
+"""
+Check query predicate masks against plain per-event evaluation on random
+columns of every width and signedness, then time cold queries on a log:
+
+    python -m benchmarks.query_masks --trials 200 --events 1000000
+"""
+import argparse
+import logging
+import operator
+import random
+import time
+from array import array
+
+import parser
+import query
+from benchmarks.synthetic_log import build_log
+
+logger = logging.getLogger(__name__)
+
+COMPARISONS = {
+    "eq": operator.eq, "ne": operator.ne, "lt": operator.lt,
+    "le": operator.le, "gt": operator.gt, "ge": operator.ge,
+}
+# One column per typecode in EVENT_COLUMNS
+COLUMN_BY_CODE = {"q": "time", "Q": "src_agent", "i": "value", "I": "skill_id", "H": "src_instid", "B": "result"}
+
+
+def random_values(rnd: random.Random, low: int, high: int, count: int) -> list:
+    """Values spread over the full range, clustered (constant upper lanes) or from a few distinct values."""
+    mode = rnd.randrange(4)
+    if mode == 0:
+        return [rnd.randint(low, high) for _ in range(count)]
+    if mode == 1:
+        base = rnd.randint(low, max(low, high - 1000))
+        return [min(base + rnd.randint(0, 600), high) for _ in range(count)]
+    if mode == 2:
+        pool = [rnd.randint(low, high) for _ in range(4)]
+        return [rnd.choice(pool) for _ in range(count)]
+    value = rnd.randint(low, high)
+    return [value] * count  # every lane constant
+
+
+def expected_mask(op: str, operand, values: list) -> bytes:
+    if op == "in":
+        return bytes(value in operand for value in values)
+    if op == "between":
+        low, high = operand
+        return bytes(low <= value <= high for value in values)
+    return bytes(COMPARISONS[op](value, operand) for value in values)
+
+
+def check_column(rnd: random.Random, code: str) -> int:
+    bits = 8 * array(code).itemsize
+    low = -(1 << (bits - 1)) if code.islower() else 0
+    high = low + (1 << bits) - 1
+    count = rnd.choice([0, 1, 2, rnd.randint(3, 400)])
+    values = random_values(rnd, low, high, count)
+
+    columns = {name: array(column_code, bytes(array(column_code).itemsize * count))
+               for name, (column_code, _) in query.EVENT_COLUMNS.items()}
+    column = COLUMN_BY_CODE[code]
+    columns[column] = array(code, values)
+    table = query.EventTable([None] * count, columns)
+
+    # Bounds from the data, its neighbours and both ends of the type, plus out-of-range ones
+    candidates = values[:3] + [v + 1 for v in values[:2]] + [v - 1 for v in values[:2]]
+    candidates += [low, high, low - 1, high + 1, low - (1 << 70), high + (1 << 70), 0, rnd.randint(low, high)]
+    predicates = [(op, rnd.choice(candidates)) for op in COMPARISONS]
+    predicates.append(("between", tuple(sorted(rnd.sample(candidates, 2)))))
+    predicates.append(("between", tuple(sorted(rnd.sample(candidates, 2), reverse=True))))  # low > high
+    predicates.append(("in", frozenset(rnd.sample(candidates, 4))))
+    predicates.append(("in", frozenset()))
+    predicates.append(("in", frozenset(rnd.randint(low, high) for _ in range(40)) | frozenset(values[:5])))
+
+    for op, operand in predicates:
+        got = table.where(**{f"{column}__{op}": operand}).mask()
+        assert got == expected_mask(op, operand, values), (code, op, operand, values)
+    return len(predicates)
+
+
+def check_log(event_count: int) -> None:
+    """Multi-predicate queries on a synthetic log against per-event filtering, then cold timings."""
+    _, _, _, raw = parser.parse_evtc_bytes(build_log(event_count), raw_events=True)
+    events = query.EventTable.from_records(raw).events
+    queries = [
+        dict(is_statechange=0, value__gt=100, skill_id__in=[1, 5, 9, 77, 120], time__between=(1_200_000, 1_600_000)),
+        dict(src_agent__ne=0x1000, dst_instid__le=120, buff_dmg__ge=1),
+        dict(value__lt=0, skill_id__between=(50, 60)),
+    ]
+    for predicates in queries:
+        table = query.EventTable.from_records(raw)
+        for name in query.EVENT_COLUMNS:
+            table.columns[name]
+        start = time.perf_counter()
+        found = table.where(**predicates).count()
+        elapsed = time.perf_counter() - start
+
+        expected = 0
+        parsed = [query._parse_predicate(key, value) for key, value in predicates.items()]
+        for event in events:
+            expected += all(
+                expected_mask(op, operand, [getattr(event, column)]) == b"\x01" for column, op, operand in parsed
+            )
+        assert found == expected, (predicates, found, expected)
+        logger.info("%d events, %s: %d matches, cold %.1f ms", len(events), sorted(predicates), found, elapsed * 1000)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    arg_parser = argparse.ArgumentParser(description="Check query masks against per-event evaluation")
+    arg_parser.add_argument("--trials", type=int, default=200, help="random columns per typecode")
+    arg_parser.add_argument("--events", type=int, default=200000, help="events in the synthetic log")
+    arg_parser.add_argument("--seed", type=int, default=1)
+    args = arg_parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    for code in COLUMN_BY_CODE:
+        checked = sum(check_column(rnd, code) for _ in range(args.trials))
+        logger.info("typecode %s: %d predicates match per-event evaluation", code, checked)
+    check_log(args.events)
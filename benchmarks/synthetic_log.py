@@ -0,0 +1,51 @@
+import random
+import struct
+
+import parser
+from cbtstatechange import CbtStateChange
+
+TEAM_IDS = (705, 2739, 432)
+
+
+def build_log(event_count: int = 20000, player_count: int = 50, seed: int = 1) -> bytes:
+    """
+    Build an uncompressed EVTC log: half the players are squad members on one
+    team, the rest enemies split across two others, each with a TEAM_CHANGE
+    event followed by `event_count` random hits and condition ticks.
+    """
+    rnd = random.Random(seed)
+    out = bytearray(struct.pack("<4s8sBHB", b"EVTC", b"20250525", 0, 1, 0))
+
+    agents = []
+    addresses = [0x1000 + i for i in range(player_count)]
+    for i, address in enumerate(addresses):
+        if i < player_count // 2:
+            name, elite = f"Char{i}\x00:Acct{i}.1234\x00{1 + i % 5}".encode(), 62
+        else:
+            name, elite = f"Foe {i}".encode(), 0
+        agents.append(struct.pack(parser.AGENT_STRUCT, address, 1 + i % 9, elite, 0, 0, 0, 0, 0, 0, name))
+    agents.append(struct.pack(parser.AGENT_STRUCT, 0x9999, 5, 0xFFFFFFFF, 0, 0, 0, 0, 0, 0, b"gadget"))
+    out += struct.pack("<I", len(agents)) + b"".join(agents)
+
+    skills = [struct.pack("<i64s", skill_id, f"Skill {skill_id}".encode()) for skill_id in range(1, 300)]
+    out += struct.pack("<I", len(skills)) + b"".join(skills)
+
+    record = struct.Struct(parser.EVENT_STRUCT)
+    time = 1_000_000
+    for i, address in enumerate(addresses):
+        team = TEAM_IDS[0] if i < player_count // 2 else TEAM_IDS[1 + i % 2]
+        out += record.pack(
+            time, address, team, 0, 0, 0, 0, 100 + i, 0, 0, 0,
+            0, 0, 0, 0, 0, 0, 0, 0, CbtStateChange.TEAM_CHANGE, 0, 0, 0, 0,
+        )
+    for _ in range(event_count):
+        time += rnd.randint(0, 20)
+        src, dst = rnd.randrange(player_count), rnd.randrange(player_count)
+        is_buff = rnd.random() < 0.3
+        out += record.pack(
+            time, addresses[src], addresses[dst],
+            0 if is_buff else rnd.randint(-500, 3000), rnd.randint(0, 800) if is_buff else 0,
+            0, rnd.randint(1, 299), 100 + src, 100 + dst, 0, 0,
+            rnd.randint(0, 2), int(is_buff), 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
+        )
+    return bytes(out)
@@ -0,0 +1,156 @@
+import struct
+from array import array
+from typing import Dict, Iterator, List, Optional
+
+import parser
+import query
+
+# Flag columns eligible for bit packing when every value in a log is 0 or 1
+FLAG_COLUMNS = (
+    "buff", "is_activation", "is_buffremove", "is_ninety", "is_fifty",
+    "is_moving", "is_flanking", "is_shields", "is_offcycle", "iff", "result", "is_statechange",
+)
+MAX_FLAG_BITS = 8
+AGENT_COLUMNS = ("src_agent", "dst_agent")
+ITER_CHUNK = 4096  # events decoded at a time when iterating a store
+
+
+def _bit_table(bit: int) -> bytes:
+    """translate() table mapping a packed flag byte to the value of one bit."""
+    return bytes((byte >> bit) & 1 for byte in range(256))
+
+
+class CompactEventStore:
+    """
+    Lossless, memory-light copy of a log's events for keeping many logs resident.
+
+    - `src_agent`/`dst_agent` become uint16 indices into `agent_ids`, which
+      starts with the agent table and appends any other address seen (e.g. team
+      ids in statechange events); uint32 is used if a log needs more entries.
+    - `time` is stored as an int32 offset from the first event (int64 if a log
+      spans more than that).
+    - Flag bytes that are only ever 0/1 share one bitfield byte per event.
+    - Columns holding a single value for the whole log are kept as one constant.
+
+    `to_records()` rebuilds the exact packed records for
+    `query.EventTable.from_records`, and iterating decodes EvtcEvent objects
+    `ITER_CHUNK` at a time. Nothing in the watchdog keeps logs resident yet,
+    so this is a library for callers that do.
+    """
+
+    def __init__(self, columns: Dict[str, array], agents: Optional[List] = None):
+        self.size = len(columns["time"])
+        self.constants: Dict[str, int] = {}
+        self.encoded: Dict[str, array] = {}
+        self.flag_fields: List[str] = []
+        self.flag_bits = array("B")
+
+        for name, values in columns.items():
+            if self.size and values.count(values[0]) == self.size:
+                self.constants[name] = values[0]
+
+        self.agent_ids = array("Q", (agent.address for agent in agents or []))
+        agent_index = {address: index for index, address in enumerate(self.agent_ids)}
+        for name in AGENT_COLUMNS:
+            if name in self.constants:
+                continue
+            for address in set(columns[name]) - agent_index.keys():
+                agent_index[address] = len(self.agent_ids)
+                self.agent_ids.append(address)
+        index_code = "H" if len(self.agent_ids) <= 0xFFFF else "I"
+        for name in AGENT_COLUMNS:
+            if name not in self.constants:
+                self.encoded[name] = array(index_code, map(agent_index.__getitem__, columns[name]))
+
+        self.time_base = columns["time"][0] if self.size else 0
+        if "time" not in self.constants:
+            offsets = map((-self.time_base).__add__, columns["time"])
+            try:
+                self.encoded["time"] = array("i", offsets)
+            except OverflowError:
+                self.encoded["time"] = array("q", map((-self.time_base).__add__, columns["time"]))
+
+        packed = 0
+        for name in FLAG_COLUMNS:
+            values = columns[name]
+            if not self.size or name in self.constants or len(self.flag_fields) == MAX_FLAG_BITS or max(values) > 1:
+                continue
+            bit = len(self.flag_fields)
+            self.flag_fields.append(name)
+            packed |= int.from_bytes(values.tobytes(), "little") << bit
+        if self.flag_fields:
+            self.flag_bits = array("B", packed.to_bytes(self.size, "little"))
+
+        for name, values in columns.items():
+            if name not in self.constants and name not in self.encoded and name not in self.flag_fields:
+                self.encoded[name] = values
+
+    @classmethod
+    def from_events(cls, agents: List, events: List) -> "CompactEventStore":
+        return cls(query.EventTable(events).columns, agents)
+
+    @classmethod
+    def from_records(cls, agents: List, raw: bytes) -> "CompactEventStore":
+        """Build from packed records, e.g. `parse_evtc(..., raw_events=True)`."""
+        table = query.EventTable.from_records(raw)
+        return cls({name: table.columns[name] for name in query.EVENT_COLUMNS}, agents)
+
+    def column(self, name: str, start: int = 0, stop: Optional[int] = None) -> array:
+        """Decode one column, or events [start, stop) of it, back to its original EVENT_STRUCT type."""
+        code = query.EVENT_COLUMNS[name][0]
+        stop = self.size if stop is None else min(stop, self.size)
+        if name in self.constants:
+            return array(code, [self.constants[name]]) * max(stop - start, 0)
+        if name in self.flag_fields:
+            bit = self.flag_fields.index(name)
+            return array(code, self.flag_bits[start:stop].tobytes().translate(_bit_table(bit)))
+        values = self.encoded[name][start:stop]
+        if name in AGENT_COLUMNS:
+            return array(code, map(self.agent_ids.__getitem__, values))
+        if name == "time":
+            return array(code, map(self.time_base.__add__, values))
+        return values
+
+    def to_records(self, start: int = 0, stop: Optional[int] = None) -> bytes:
+        """Rebuild the packed EVENT_STRUCT records, or events [start, stop) of them, byte for byte."""
+        stop = self.size if stop is None else min(stop, self.size)
+        records = bytearray(max(stop - start, 0) * parser.EVENT_SIZE)
+        for name, (code, offset) in query.EVENT_COLUMNS.items():
+            width = array(code).itemsize
+            memoryview(records).cast(code)[offset // width::parser.EVENT_SIZE // width] = self.column(name, start, stop)
+        return bytes(records)
+
+    def to_table(self) -> query.EventTable:
+        return query.EventTable.from_records(self.to_records())
+
+    def memory_bytes(self) -> int:
+        """Bytes held by the encoded arrays."""
+        arrays = [self.agent_ids, self.flag_bits, *self.encoded.values()]
+        return sum(values.itemsize * len(values) for values in arrays)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __getitem__(self, index: int) -> parser.EvtcEvent:
+        if index < 0:
+            index += self.size
+        if not 0 <= index < self.size:
+            raise IndexError("event index out of range")
+        return parser.EvtcEvent(*(self._value(name, index) for name in query.EVENT_COLUMNS))
+
+    def __iter__(self) -> Iterator[parser.EvtcEvent]:
+        for start in range(0, self.size, ITER_CHUNK):
+            for fields in struct.iter_unpack(parser.EVENT_STRUCT, self.to_records(start, start + ITER_CHUNK)):
+                yield parser.EvtcEvent(*fields)
+
+    def _value(self, name: str, index: int) -> int:
+        if name in self.constants:
+            return self.constants[name]
+        if name in self.flag_fields:
+            return (self.flag_bits[index] >> self.flag_fields.index(name)) & 1
+        value = self.encoded[name][index]
+        if name in AGENT_COLUMNS:
+            return self.agent_ids[value]
+        if name == "time":
+            return self.time_base + value
+        return value
@@ -0,0 +1,324 @@
+import argparse
+import asyncio
+import configparser
+import json
+import logging
+import multiprocessing
+import os
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Dict, Optional, Tuple
+from urllib.parse import unquote, urlsplit
+
+import parser
+import query
+import watchdog_fightCount as fight_watchdog
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+# Worst-case memory is MAX_BUFFERED_UPLOADS * MAX_UPLOAD_MB of shared memory for
+# bodies plus ~2 * MAX_UPLOAD_MB per parsing worker (a .zevtc member and its
+# event records): 8 * 32 + 4 * 2 * 32 = ~512 MB with these defaults
+MAX_UPLOAD_MB = 32
+MAX_CONCURRENT_UPLOADS = 4
+MAX_BUFFERED_UPLOADS = 8
+READ_TIMEOUT = 60  # seconds to receive the headers, and again the body
+READ_CHUNK = 64 * 1024
+HEADER_LIMIT = 16 * 1024
+
+HTTP_REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    405: "Method Not Allowed",
+    411: "Length Required",
+    413: "Payload Too Large",
+    422: "Unprocessable Entity",
+    500: "Internal Server Error",
+}
+
+
+def summarize_upload(file_name: str, block_name: str, size: int, max_bytes: int) -> Tuple[Tuple, bool, int]:
+    """
+    Parse an upload in a worker process, reading the body in place from the
+    server's shared memory block, and return only the summary so neither the
+    body nor the event list is pickled. A .zevtc member may expand to at most
+    `max_bytes`.
+    """
+    block = shared_memory.SharedMemory(name=block_name)
+    body = block.buf[:size]
+    try:
+        if file_name.lower().endswith(".zevtc"):
+            with parser.BufferReader(body) as stream, zipfile.ZipFile(stream) as zip_ref:
+                members = zip_ref.infolist()
+                if not members:
+                    raise ValueError("Archive contains no log")
+                if members[0].file_size > max_bytes:
+                    raise ValueError(f"Log expands to {members[0].file_size} bytes, over the {max_bytes} byte limit")
+                data = zip_ref.read(members[0])
+        else:
+            data = body
+        header, agents, skills, raw_events = parser.parse_evtc_bytes(data, recover=True, raw_events=True)
+    finally:
+        body.release()
+        block.close()
+    events = query.EventTable.from_records(raw_events)
+    summary = fight_watchdog.summarize_log(agents, events)
+    return summary, header.truncated, len(events)
+
+
+def release_block(block: shared_memory.SharedMemory) -> None:
+    block.close()
+    block.unlink()
+
+
+class IngestServer:
+    """
+    HTTP endpoint accepting `POST /<name>.evtc|.zevtc` uploads from squad members.
+    Each body is streamed chunk by chunk into a shared memory block that a
+    process pool worker parses in place, so the server never holds it on its
+    own heap. At most `max_buffered` bodies are held and `max_concurrent`
+    parsed at once. Receiving the headers, and then the body, each give up
+    after `read_timeout` seconds, and idle clients never hold a parse slot.
+    """
+
+    def __init__(
+        self,
+        webhook_url: Optional[str],
+        host: str = DEFAULT_HOST,
+        port: int = DEFAULT_PORT,
+        max_upload_bytes: int = MAX_UPLOAD_MB * 1024 * 1024,
+        max_concurrent: int = MAX_CONCURRENT_UPLOADS,
+        max_buffered: int = MAX_BUFFERED_UPLOADS,
+        read_timeout: float = READ_TIMEOUT,
+        workers: Optional[int] = None,
+    ):
+        self.webhook_url = webhook_url
+        self.host = host
+        self.port = port
+        self.max_upload_bytes = max_upload_bytes
+        self.max_concurrent = max_concurrent
+        self.max_buffered = max_buffered
+        self.read_timeout = read_timeout
+        self.workers = workers
+        self.pool: Optional[ProcessPoolExecutor] = None
+        self.server: Optional[asyncio.base_events.Server] = None
+        self.parse_slots: Optional[asyncio.Semaphore] = None
+        self.buffer_slots: Optional[asyncio.Semaphore] = None
+
+    async def start(self) -> None:
+        # Spawned workers do not inherit open client sockets, which would keep
+        # connections from closing when the server finishes a response.
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        self.parse_slots = asyncio.Semaphore(self.max_concurrent)
+        self.buffer_slots = asyncio.Semaphore(self.max_buffered)
+        self.server = await asyncio.start_server(self.handle, self.host, self.port, limit=HEADER_LIMIT)
+        self.port = self.server.sockets[0].getsockname()[1]
+        logger.info("Ingest server listening on http://%s:%d", self.host, self.port)
+
+    async def stop(self) -> None:
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+        if self.pool:
+            self.pool.shutdown()
+
+    async def serve_forever(self) -> None:
+        await self.start()
+        try:
+            await self.server.serve_forever()
+        finally:
+            await self.stop()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            status, body = await self.handle_request(reader)
+        except asyncio.TimeoutError:
+            logger.warning("Dropped upload connection: request not received within %ss", self.read_timeout)
+            writer.close()
+            return
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError) as e:
+            logger.warning("Dropped upload connection: %s", e)
+            writer.close()
+            return
+        except Exception as e:
+            logger.exception("Error handling upload: %s", e)
+            status, body = 500, {"error": str(e)}
+
+        payload = json.dumps(body).encode()
+        writer.write(
+            f"HTTP/1.1 {status} {HTTP_REASONS[status]}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            f"Connection: close\r\n\r\n".encode() + payload
+        )
+        try:
+            await writer.drain()
+            # Half-close and drain whatever the client is still sending (e.g. the
+            # body of a rejected upload); closing with unread data would reset
+            # the connection before the client reads the response.
+            if writer.can_write_eof():
+                writer.write_eof()
+            await asyncio.wait_for(self.discard(reader), self.read_timeout)
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        writer.close()
+
+    @staticmethod
+    async def discard(reader: asyncio.StreamReader) -> None:
+        while await reader.read(READ_CHUNK):
+            pass
+
+    @staticmethod
+    async def receive_body(reader: asyncio.StreamReader, content_length: int) -> shared_memory.SharedMemory:
+        """Copy the body as it arrives into a shared memory block for the parse worker."""
+        block = shared_memory.SharedMemory(create=True, size=max(content_length, 1))
+        try:
+            received = 0
+            while received < content_length:
+                chunk = await reader.read(min(READ_CHUNK, content_length - received))
+                if not chunk:
+                    raise asyncio.IncompleteReadError(b"", content_length)
+                block.buf[received:received + len(chunk)] = chunk
+                received += len(chunk)
+        except BaseException:
+            release_block(block)
+            raise
+        return block
+
+    async def handle_request(self, reader: asyncio.StreamReader) -> Tuple[int, Dict]:
+        head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), self.read_timeout)
+        request_line, *header_lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, target, _ = request_line.split(" ", 2)
+        except ValueError:
+            return 400, {"error": "Malformed request line"}
+        headers = {}
+        for line in header_lines:
+            if ":" in line:
+                key, value = line.split(":", 1)
+                headers[key.strip().lower()] = value.strip()
+
+        if method != "POST":
+            return 405, {"error": "Uploads must use POST"}
+        file_name = os.path.basename(unquote(urlsplit(target).path))
+        if not file_name.lower().endswith((".evtc", ".zevtc")):
+            return 400, {"error": "Upload path must name a .evtc or .zevtc file"}
+        if "content-length" not in headers:
+            return 411, {"error": "Content-Length is required"}
+        try:
+            content_length = int(headers["content-length"])
+        except ValueError:
+            content_length = -1
+        if content_length < 0:
+            return 400, {"error": "Content-Length must be a non-negative integer"}
+        if content_length > self.max_upload_bytes:
+            return 413, {"error": f"Upload exceeds {self.max_upload_bytes} bytes"}
+
+        async with self.buffer_slots:
+            block = await asyncio.wait_for(self.receive_body(reader, content_length), self.read_timeout)
+            try:
+                async with self.parse_slots:
+                    parse_start = time.perf_counter()
+                    loop = asyncio.get_running_loop()
+                    summary, truncated, event_count = await loop.run_in_executor(
+                        self.pool, summarize_upload, file_name, block.name, content_length, self.max_upload_bytes
+                    )
+            except (ValueError, EOFError, zipfile.BadZipFile) as e:
+                logger.error("Rejected upload %s: %s", file_name, e)
+                return 422, {"error": str(e)}
+            finally:
+                release_block(block)
+
+        squad_count, team_report, squad_comp, squad_color = summary
+        logger.info(
+            "Parsed upload %s: %d events in %.3fs", file_name, event_count, time.perf_counter() - parse_start
+        )
+        if truncated:
+            logger.warning("%s is truncated, summarizing %d complete events", file_name, event_count)
+        await loop.run_in_executor(
+            None, fight_watchdog.publish_summary,
+            self.webhook_url, file_name, squad_count, team_report, squad_comp, squad_color,
+        )
+        return 200, {
+            "file": file_name,
+            "events": event_count,
+            "truncated": truncated,
+            "squad_count": squad_count,
+            "teams": {team: sum(counter.values()) for team, counter in team_report.items()},
+        }
+
+
+async def upload_log(host: str, port: int, file_name: str, data: bytes) -> Tuple[int, Dict]:
+    """POST one log to an ingest server and return (status, response body)."""
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(
+        f"POST /{file_name} HTTP/1.1\r\nHost: {host}\r\n"
+        f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode()
+    )
+    for offset in range(0, len(data), READ_CHUNK):
+        writer.write(data[offset:offset + READ_CHUNK])
+        await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, body = response.partition(b"\r\n\r\n")
+    status = int(head.split(b" ", 2)[1])
+    return status, json.loads(body or b"{}")
+
+
+async def run_load_test(host: str, port: int, file_path: str, clients: int) -> None:
+    """Upload the same log from `clients` concurrent connections and report latency."""
+    with open(file_path, "rb") as f:
+        data = f.read()
+    file_name = os.path.basename(file_path)
+
+    async def timed_upload() -> Tuple[int, float]:
+        start = time.perf_counter()
+        status, _ = await upload_log(host, port, file_name, data)
+        return status, time.perf_counter() - start
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(timed_upload() for _ in range(clients)))
+    elapsed = time.perf_counter() - start
+    latencies = sorted(latency for _, latency in results)
+    statuses = [status for status, _ in results]
+    logger.info(
+        "%d uploads of %s in %.2fs: %d ok, median %.3fs, max %.3fs",
+        clients, file_name, elapsed, statuses.count(200),
+        latencies[len(latencies) // 2], latencies[-1],
+    )
+
+
+# --- Main entry ---
+if __name__ == "__main__":
+    config_ini = configparser.ConfigParser()
+    config_ini.read("config.ini")
+    settings = config_ini["Settings"] if config_ini.has_section("Settings") else {}
+    ingest = config_ini["Ingest"] if config_ini.has_section("Ingest") else {}
+
+    arg_parser = argparse.ArgumentParser(description="Accept EVTC uploads from squad members over HTTP")
+    arg_parser.add_argument("--host", default=ingest.get("HOST", DEFAULT_HOST))
+    arg_parser.add_argument("--port", type=int, default=int(ingest.get("PORT", DEFAULT_PORT)))
+    arg_parser.add_argument("--load-test", metavar="LOG_FILE", help="upload LOG_FILE concurrently to a running server")
+    arg_parser.add_argument("--clients", type=int, default=50, help="concurrent clients for --load-test")
+    args = arg_parser.parse_args()
+
+    if args.load_test:
+        asyncio.run(run_load_test(args.host, args.port, args.load_test, args.clients))
+    else:
+        server = IngestServer(
+            webhook_url=settings.get("WEBHOOK_URL"),
+            host=args.host,
+            port=args.port,
+            max_upload_bytes=int(ingest.get("MAX_UPLOAD_MB", MAX_UPLOAD_MB)) * 1024 * 1024,
+            max_concurrent=int(ingest.get("MAX_CONCURRENT", MAX_CONCURRENT_UPLOADS)),
+            max_buffered=int(ingest.get("MAX_BUFFERED", MAX_BUFFERED_UPLOADS)),
+            read_timeout=float(ingest.get("READ_TIMEOUT", READ_TIMEOUT)),
+        )
+        try:
+            asyncio.run(server.serve_forever())
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,188 @@
+import heapq
+import logging
+import struct
+from collections import defaultdict, deque
+from dataclasses import fields, replace
+from itertools import islice
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
+
+import parser
+import query
+from cbtstatechange import CbtStateChange
+
+logger = logging.getLogger(__name__)
+
+CHUNK_EVENTS = 4096  # records buffered per input log
+TIME_TOLERANCE_MS = 1000  # LOG_START only aligns POVs to the second
+START_SCAN_EVENTS = 10000  # how far into a log to look for its LOG_START event
+
+# Fields that must match for two POV events to count as the same event
+DEDUP_FIELDS = (
+    "src_agent", "dst_agent", "skill_id", "value", "buff_dmg", "overstack_value",
+    "iff", "buff", "result", "is_activation", "is_buffremove", "is_statechange",
+)
+
+
+def agent_identity(agent: parser.EvtcAgent) -> Tuple[str, int, int]:
+    """Key used to recognise the same agent in logs recorded by different players."""
+    return agent.name, agent.profession, agent.is_elite
+
+
+def find_time_offset(file_path: str) -> Optional[int]:
+    """
+    Offset that maps this log's local timestamps onto server time in ms,
+    taken from the LOG_START statechange (value holds server unix seconds).
+    """
+    for event in islice(parser.iter_evtc_events(file_path), START_SCAN_EVENTS):
+        if event.is_statechange == CbtStateChange.SQ_COMBAT_START:
+            return (event.value & 0xFFFFFFFF) * 1000 - event.time
+    return None
+
+
+class MergedLog:
+    """
+    Several POV logs of one fight merged into a single event stream.
+
+    Agents are reconciled across files by (name, profession, elite) when that
+    key is unique within a log, so squad members (named `Character:Account`)
+    map to one address; anything ambiguous keeps a separate agent per POV.
+    Events are streamed through a heap-based k-way merge on time with at most
+    `chunk_events` records buffered per input. Matching events from different
+    POVs within `time_tolerance_ms` of each other are emitted once.
+    """
+
+    def __init__(
+        self,
+        file_paths: List[str],
+        chunk_events: int = CHUNK_EVENTS,
+        time_tolerance_ms: int = TIME_TOLERANCE_MS,
+    ):
+        if not file_paths:
+            raise ValueError("At least one log is required to merge")
+        self.file_paths = file_paths
+        self.chunk_events = chunk_events
+        self.time_tolerance_ms = time_tolerance_ms
+        self.duplicates_dropped = 0
+
+        self.agents: List[parser.EvtcAgent] = []
+        self.skills: List[parser.EvtcSkill] = []
+        self.address_maps: List[Dict[int, int]] = []
+        self.time_offsets: List[int] = []
+        self.header = None
+
+        by_identity: Dict[Tuple, int] = {}
+        used_addresses = set()
+        skill_ids = set()
+        for file_path in file_paths:
+            header, agents, skills = parser.parse_evtc_tables(file_path)
+            if self.header is None:
+                self.header = replace(header)
+            self.header.truncated = self.header.truncated or header.truncated
+
+            identity_counts = defaultdict(int)
+            for agent in agents:
+                identity_counts[agent_identity(agent)] += 1
+
+            address_map: Dict[int, int] = {}
+            for agent in agents:
+                identity = agent_identity(agent)
+                unique = agent.name and identity_counts[identity] == 1
+                if unique and identity in by_identity:
+                    address_map[agent.address] = by_identity[identity]
+                    continue
+                address = agent.address
+                while address in used_addresses:
+                    address += 1 << 48  # outside the range of real agent addresses
+                used_addresses.add(address)
+                address_map[agent.address] = address
+                if unique:
+                    by_identity[identity] = address
+                self.agents.append(replace(agent, address=address, team="", instid=0))
+            self.address_maps.append(address_map)
+
+            for skill in skills:
+                if skill.skill_id not in skill_ids:
+                    skill_ids.add(skill.skill_id)
+                    self.skills.append(skill)
+
+        offsets = [find_time_offset(file_path) for file_path in file_paths]
+        if None in offsets:
+            logger.warning("LOG_START missing from a log, assuming all POVs share one clock")
+            self.time_offsets = [0] * len(file_paths)
+        else:
+            self.time_offsets = [offset - offsets[0] for offset in offsets]
+
+    def _pov_events(self, pov: int) -> Iterator[Tuple[int, int, parser.EvtcEvent]]:
+        offset = self.time_offsets[pov]
+        for event in parser.iter_evtc_events(self.file_paths[pov], self.chunk_events):
+            yield event.time + offset, pov, event
+
+    def events(self) -> Iterator[parser.EvtcEvent]:
+        """Yield the unified, de-duplicated event stream in time order."""
+        self.duplicates_dropped = 0
+        unified_instids: Dict[int, int] = {}  # unified address -> instid
+        instid_owners: Dict[int, int] = {}  # instid -> unified address
+        instid_maps: List[Dict[int, int]] = [{} for _ in self.file_paths]
+        # Per key, how often each POV saw it inside the tolerance window; the
+        # stream carries max(count) copies, so POVs that missed an event or saw
+        # it more often than others both reconcile correctly
+        recent: Dict[Tuple, Dict[int, int]] = {}
+        expiry: Deque[Tuple[int, int, Tuple]] = deque()
+
+        def unify_instid(pov: int, address: int, instid: int) -> int:
+            if not instid or address is None:
+                return instid_maps[pov].get(instid, instid)
+            unified = unified_instids.get(address)
+            if unified is None:
+                unified = instid
+                while instid_owners.get(unified, address) != address:
+                    unified += 1
+                unified_instids[address] = unified
+                instid_owners[unified] = address
+            instid_maps[pov][instid] = unified
+            return unified
+
+        streams = [self._pov_events(pov) for pov in range(len(self.file_paths))]
+        for time, pov, event in heapq.merge(*streams, key=lambda item: item[0]):
+            address_map = self.address_maps[pov]
+            src_agent = address_map.get(event.src_agent)
+            dst_agent = address_map.get(event.dst_agent)
+            instid_map = instid_maps[pov]
+            event = replace(
+                event,
+                time=time,
+                src_agent=event.src_agent if src_agent is None else src_agent,
+                dst_agent=event.dst_agent if dst_agent is None else dst_agent,
+                src_instid=unify_instid(pov, src_agent, event.src_instid),
+                dst_instid=unify_instid(pov, dst_agent, event.dst_instid),
+                src_master_instid=instid_map.get(event.src_master_instid, event.src_master_instid),
+                dst_master_instid=instid_map.get(event.dst_master_instid, event.dst_master_instid),
+            )
+
+            while expiry and expiry[0][0] < time - self.time_tolerance_ms:
+                _, expired_pov, expired_key = expiry.popleft()
+                counts = recent[expired_key]
+                counts[expired_pov] -= 1
+                if not any(counts.values()):
+                    del recent[expired_key]
+
+            key = tuple(getattr(event, field) for field in DEDUP_FIELDS)
+            counts = recent.setdefault(key, {})
+            emitted = max(counts.values(), default=0)
+            counts[pov] = counts.get(pov, 0) + 1
+            expiry.append((time, pov, key))
+            if counts[pov] <= emitted:
+                self.duplicates_dropped += 1
+                continue
+            yield event
+
+    def to_table(self) -> query.EventTable:
+        """
+        Collect the merged stream as packed records for the query and watchdog
+        analyzers; this holds the whole fight at 64 bytes per event.
+        """
+        record = struct.Struct(parser.EVENT_STRUCT)
+        names = [field.name for field in fields(parser.EvtcEvent)]
+        return query.EventTable.from_records(
+            b"".join(record.pack(*(getattr(event, name) for name in names)) for event in self.events())
+        )
@@ -1,10 +1,16 @@
+import io
+import os
 import struct
 import sys
 import traceback
 import gc
-from typing import List, Dict, NamedTuple, Tuple
+from typing import BinaryIO, Iterator, List, Dict, NamedTuple, Tuple, Union
 from collections import defaultdict
 from dataclasses import dataclass
+from functools import lru_cache
+
+HEADER_SIZE = 16
+COUNT_SIZE = 4
 
 AGENT_STRUCT = '<QIIHHHHHH64s4x'  # Q: uint64, I: uint32, H: uint16, 64s: char[64]
 AGENT_SIZE = struct.calcsize(AGENT_STRUCT)
@@ -13,12 +19,17 @@ SKILL_SIZE = 68
 EVENT_STRUCT = '<qQQiiIIHHHHBBBBBBBBBBBBI'
 EVENT_SIZE = struct.calcsize(EVENT_STRUCT)
 
+# Process-wide bounds for names and skills shared across parsed logs
+MAX_INTERNED_NAMES = 16384
+MAX_INTERNED_SKILLS = 16384
+
 @dataclass
 class EvtcHeader:
     magic: str
     version: str
     instruction_set_id: int
     revision: int
+    truncated: bool = False
 
 @dataclass
 class EvtcAgent:
@@ -34,7 +45,7 @@ class EvtcAgent:
     team: str
     instid: int
 
-@dataclass
+@dataclass(frozen=True)
 class EvtcSkill:
     skill_id: int
     name: str
@@ -66,6 +77,32 @@ class EvtcEvent:
     is_offcycle: int
     pad: int
 
+@lru_cache(maxsize=MAX_INTERNED_NAMES)
+def decode_agent_name(raw_name: bytes) -> Tuple[str, int]:
+    """
+    Decode a raw 64-byte agent name into (name, party).
+    Cached so the same character/account across fights shares one string.
+    """
+    name = raw_name.decode('utf-8', errors='replace').rstrip('\x00')
+    if "." in name and name[-1].isdigit():
+        party = int(name[-1])
+    else:
+        party = 0
+    return name, party
+
+@lru_cache(maxsize=MAX_INTERNED_SKILLS)
+def decode_skill(skill_data: bytes) -> EvtcSkill:
+    """
+    Decode a raw skill record. Cached so every log references the same
+    EvtcSkill objects, which are frozen for that reason.
+    """
+    skill_id, name = struct.unpack('<i64s', skill_data)
+    return EvtcSkill(skill_id=skill_id, name=name.decode('utf-8', errors='replace').rstrip('\x00'))
+
+def intern_cache_info() -> Dict[str, Tuple]:
+    """Hit/miss counters for the cross-log name and skill caches."""
+    return {"names": decode_agent_name.cache_info(), "skills": decode_skill.cache_info()}
+
 def free_evtc_data(header, agents, skills, events):
     """
     Explicitly delete EVTC objects and trigger garbage collection
@@ -76,125 +113,227 @@ def free_evtc_data(header, agents, skills, events):
     del agents
     del skills[:]
     del skills
-    del events[:]
+    if isinstance(events, list):
+        del events[:]
     del events
     gc.collect()
     print("---=== Memory freed ===---")
 
-def parse_evtc(file_path: str) -> Tuple[EvtcHeader, List[EvtcAgent], List[EvtcSkill], List[EvtcEvent]]:
+@dataclass
+class EvtcLayout:
+    agent_count: int
+    skill_count: int
+    event_count: int
+    events_offset: int
+    trailing_bytes: int
+
+def validate_evtc(file_path: str) -> EvtcLayout:
+    """
+    Check section counts against the file size without decoding any records.
+    Raises EOFError if the header, agent or skill sections are cut short.
+    A partial trailing event is reported through `trailing_bytes`.
+    """
+    with open(file_path, 'rb') as f:
+        return _read_layout(f, os.path.getsize(file_path))
+
+def _read_layout(f: BinaryIO, file_size: int) -> EvtcLayout:
+    if file_size < HEADER_SIZE + COUNT_SIZE:
+        raise EOFError("File too short to contain a valid header")
+    f.seek(0)
+    magic = f.read(4)
+    if magic != b'EVTC':
+        raise ValueError(f"Invalid EVTC file: magic number is {magic!r}, expected 'EVTC'")
+
+    f.seek(HEADER_SIZE)
+    agent_count = struct.unpack('<I', f.read(COUNT_SIZE))[0]
+    skill_count_offset = HEADER_SIZE + COUNT_SIZE + agent_count * AGENT_SIZE
+    if file_size < skill_count_offset + COUNT_SIZE:
+        raise EOFError(f"File size {file_size} too small for {agent_count} agents")
+
+    f.seek(skill_count_offset)
+    skill_count = struct.unpack('<I', f.read(COUNT_SIZE))[0]
+    events_offset = skill_count_offset + COUNT_SIZE + skill_count * SKILL_SIZE
+    if file_size < events_offset:
+        raise EOFError(f"File size {file_size} too small for {skill_count} skills")
+
+    event_count, trailing_bytes = divmod(file_size - events_offset, EVENT_SIZE)
+    return EvtcLayout(agent_count, skill_count, event_count, events_offset, trailing_bytes)
+
+def parse_evtc(file_path: str, recover: bool = False, raw_events: bool = False) -> Tuple[EvtcHeader, List[EvtcAgent], List[EvtcSkill], Union[List[EvtcEvent], bytes]]:
     """
     Parse an EVTC binary log file and return its components.
-    (Same as previous implementation, included for completeness)
+    The file is validated with `validate_evtc` before decoding. With `recover`,
+    a partially written final event is dropped and `header.truncated` is set
+    instead of raising EOFError. With `raw_events`, the packed event records
+    are returned as bytes instead of EvtcEvent objects.
     """
     try:
         with open(file_path, 'rb') as f:
-            header_data = f.read(16)
-            if len(header_data) < 16:
-                raise EOFError("File too short to contain a valid header")
-            
-            magic, version, instruction_set_id, revision, padding = struct.unpack('<4s8sBHB', header_data)
-            if magic[:4] != b'EVTC':
-                raise ValueError(f"Invalid EVTC file: magic number is {magic!r}, expected 'EVTC'")
-            header = EvtcHeader(
-                magic=magic.decode('utf-8', errors='replace'),
-                version=version.decode('utf-8', errors='replace').rstrip('\x00'),
-                instruction_set_id=instruction_set_id,
-                revision=revision
-            )
-            #print(f"Header parsed: version={version}, revision={revision}, instruction_set_id={instruction_set_id}")
-            agent_count_data = f.read(4)
-            if len(agent_count_data) < 4:
-                raise EOFError("Unexpected EOF while reading agent count")
-            agent_count = struct.unpack('<I', agent_count_data)[0]
-            
-            agents = []
-            for _ in range(agent_count):
-                agent_data = f.read(AGENT_SIZE)
-                if len(agent_data) < AGENT_SIZE:
-                    raise EOFError("Unexpected EOF while reading agent data")
-                
-                addr, prof, is_elite, toughness, concentration, healing, hitbox_width, condition, hitbox_height, name = struct.unpack(AGENT_STRUCT, agent_data)
-                name = name.decode('utf-8', errors='replace').rstrip('\x00')
-                if "." in name and name[-1].isdigit():
-                    party = int(name[-1])
-                else:
-                    party = 0
-
-                agents.append(EvtcAgent(
-                    address=addr,
-                    profession=prof,
-                    is_elite=is_elite,
-                    toughness=toughness,
-                    healing=healing,
-                    condition=condition,
-                    concentration=concentration,
-                    name=name,
-                    party=party,
-                    team="",
-                    instid = 0
-
-                ))
-
-            skill_count_data = f.read(4)
-            if len(skill_count_data) < 4:
-                raise EOFError("Unexpected EOF while reading skill count")
-            skill_count = struct.unpack('<I', skill_count_data)[0]
-            
-            skills = []
-            for _ in range(skill_count):
-                skill_data = f.read(SKILL_SIZE)
-                if len(skill_data) < SKILL_SIZE:
-                    raise EOFError(f"Unexpected EOF while reading skill data (expected {SKILL_SIZE} bytes)")
-                
-                skill_id, name = struct.unpack('<i64s', skill_data)
-                name = name.decode('utf-8', errors='replace').rstrip('\x00')
-                skills.append(EvtcSkill(skill_id=skill_id, name=name))
-
-            events = []
-            while True:
-                event_data = f.read(EVENT_SIZE)
-                if not event_data:
-                    break
-                if len(event_data) < EVENT_SIZE:
-                    raise EOFError("Unexpected EOF while reading event data")
-                
-                time, src_agent, dst_agent, value, buff_dmg, overstack_value, skill_id, \
-                src_instid, dst_instid, src_master_instid, dst_master_instid, \
-                iff, buff, result, is_activation, is_buffremove, is_ninety, is_fifty, \
-                is_moving, is_statechange, is_flanking, is_shields, is_offcycle, \
-                padding = struct.unpack(EVENT_STRUCT, event_data)
-                
-                events.append(EvtcEvent(
-                    time=time,
-                    src_agent=src_agent,
-                    dst_agent=dst_agent,
-                    value=value,
-                    buff_dmg=buff_dmg,
-                    overstack_value=overstack_value,
-                    skill_id=skill_id,
-                    src_instid=src_instid,
-                    dst_instid=dst_instid,
-                    src_master_instid=src_master_instid,
-                    dst_master_instid=dst_master_instid,
-                    iff=iff,
-                    buff=buff,
-                    result=result,
-                    is_activation=is_activation,
-                    is_buffremove=is_buffremove,
-                    is_ninety=is_ninety,
-                    is_fifty=is_fifty,
-                    is_moving=is_moving,
-                    is_statechange=is_statechange,
-                    is_flanking=is_flanking,
-                    is_shields=is_shields,
-                    is_offcycle=is_offcycle,
-                    pad =padding
-                ))
-
-            return header, agents, skills, events
-
+            return _parse_stream(f, os.path.getsize(file_path), recover, raw_events)
     except FileNotFoundError:
         raise FileNotFoundError(f"EVTC file not found: {file_path}")
+
+class BufferReader(io.RawIOBase):
+    """
+    Seekable read-only file over any bytes-like object, e.g. a shared memory
+    block. Unlike io.BytesIO it does not copy the buffer up front; each read
+    copies only the bytes it returns. Close it to release the buffer.
+    """
+
+    def __init__(self, data):
+        super().__init__()
+        self._view = memoryview(data).cast('B')
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: len(self._view)}[whence]
+        self._pos = max(base + offset, 0)
+        return self._pos
+
+    def read(self, size: int = -1) -> bytes:
+        end = len(self._view) if size is None or size < 0 else self._pos + size
+        data = self._view[self._pos:end].tobytes()
+        self._pos += len(data)
+        return data
+
+    def readinto(self, buffer) -> int:
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self) -> None:
+        if not self.closed:
+            self._view.release()
+        super().close()
+
+def parse_evtc_bytes(data, recover: bool = False, raw_events: bool = False) -> Tuple[EvtcHeader, List[EvtcAgent], List[EvtcSkill], Union[List[EvtcEvent], bytes]]:
+    """
+    Parse an EVTC log already held in memory, e.g. an upload body or zip member.
+    `data` may be any bytes-like object; only the records read are copied.
+    """
+    with BufferReader(data) as f:
+        return _parse_stream(f, f.seek(0, io.SEEK_END), recover, raw_events)
+
+def parse_evtc_tables(file_path: str) -> Tuple[EvtcHeader, List[EvtcAgent], List[EvtcSkill]]:
+    """Parse only the header, agent and skill tables; pair with `iter_evtc_events`."""
+    with open(file_path, 'rb') as f:
+        header, agents, skills, _ = _parse_stream(f, os.path.getsize(file_path), True, include_events=False)
+    return header, agents, skills
+
+def iter_evtc_events(file_path: str, chunk_events: int = 4096) -> Iterator[EvtcEvent]:
+    """
+    Yield a log's events while buffering at most `chunk_events` records.
+    A partial trailing record is ignored, as with `parse_evtc(recover=True)`.
+    """
+    layout = validate_evtc(file_path)
+    with open(file_path, 'rb') as f:
+        f.seek(layout.events_offset)
+        remaining = layout.event_count
+        while remaining:
+            count = min(chunk_events, remaining)
+            for fields in struct.iter_unpack(EVENT_STRUCT, f.read(count * EVENT_SIZE)):
+                yield EvtcEvent(*fields)
+            remaining -= count
+
+def _parse_stream(f: BinaryIO, file_size: int, recover: bool, raw_events: bool = False, include_events: bool = True) -> Tuple[EvtcHeader, List[EvtcAgent], List[EvtcSkill], Union[List[EvtcEvent], bytes]]:
+    layout = _read_layout(f, file_size)
+    if layout.trailing_bytes and not recover:
+        raise EOFError(f"Unexpected EOF while reading event data ({layout.trailing_bytes} trailing bytes)")
+
+    f.seek(0)
+    try:
+        # _read_layout has checked the magic and every section size, so the
+        # reads below always return complete records
+        magic, version, instruction_set_id, revision, padding = struct.unpack('<4s8sBHB', f.read(HEADER_SIZE))
+        header = EvtcHeader(
+            magic=magic.decode('utf-8', errors='replace'),
+            version=version.decode('utf-8', errors='replace').rstrip('\x00'),
+            instruction_set_id=instruction_set_id,
+            revision=revision,
+            truncated=bool(layout.trailing_bytes)
+        )
+        #print(f"Header parsed: version={version}, revision={revision}, instruction_set_id={instruction_set_id}")
+        f.seek(COUNT_SIZE, io.SEEK_CUR)
+
+        agents = []
+        for _ in range(layout.agent_count):
+            agent_data = f.read(AGENT_SIZE)
+            addr, prof, is_elite, toughness, concentration, healing, hitbox_width, condition, hitbox_height, name = struct.unpack(AGENT_STRUCT, agent_data)
+            name, party = decode_agent_name(name)
+
+            agents.append(EvtcAgent(
+                address=addr,
+                profession=prof,
+                is_elite=is_elite,
+                toughness=toughness,
+                healing=healing,
+                condition=condition,
+                concentration=concentration,
+                name=name,
+                party=party,
+                team="",
+                instid = 0
+
+            ))
+
+        f.seek(COUNT_SIZE, io.SEEK_CUR)
+
+        skills = []
+        for _ in range(layout.skill_count):
+            skills.append(decode_skill(f.read(SKILL_SIZE)))
+
+        if not include_events:
+            return header, agents, skills, []
+        if raw_events:
+            return header, agents, skills, f.read(layout.event_count * EVENT_SIZE)
+
+        events = []
+        for _ in range(layout.event_count):
+            event_data = f.read(EVENT_SIZE)
+            time, src_agent, dst_agent, value, buff_dmg, overstack_value, skill_id, \
+            src_instid, dst_instid, src_master_instid, dst_master_instid, \
+            iff, buff, result, is_activation, is_buffremove, is_ninety, is_fifty, \
+            is_moving, is_statechange, is_flanking, is_shields, is_offcycle, \
+            padding = struct.unpack(EVENT_STRUCT, event_data)
+            
+            events.append(EvtcEvent(
+                time=time,
+                src_agent=src_agent,
+                dst_agent=dst_agent,
+                value=value,
+                buff_dmg=buff_dmg,
+                overstack_value=overstack_value,
+                skill_id=skill_id,
+                src_instid=src_instid,
+                dst_instid=dst_instid,
+                src_master_instid=src_master_instid,
+                dst_master_instid=dst_master_instid,
+                iff=iff,
+                buff=buff,
+                result=result,
+                is_activation=is_activation,
+                is_buffremove=is_buffremove,
+                is_ninety=is_ninety,
+                is_fifty=is_fifty,
+                is_moving=is_moving,
+                is_statechange=is_statechange,
+                is_flanking=is_flanking,
+                is_shields=is_shields,
+                is_offcycle=is_offcycle,
+                pad =padding
+            ))
+
+        return header, agents, skills, events
+
     except struct.error as e:
         exc_type, exc_value, exc_traceback = sys.exc_info()
         line_number = traceback.extract_tb(exc_traceback)[-1][1]
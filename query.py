@@ -0,0 +1,404 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from functools import cached_property
+from itertools import compress, islice, repeat
+import operator
+import struct
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import parser
+
+# Column typecodes and byte offsets within one EVENT_STRUCT record
+EVENT_COLUMNS = {
+    "time": ("q", 0),
+    "src_agent": ("Q", 8),
+    "dst_agent": ("Q", 16),
+    "value": ("i", 24),
+    "buff_dmg": ("i", 28),
+    "overstack_value": ("I", 32),
+    "skill_id": ("I", 36),
+    "src_instid": ("H", 40),
+    "dst_instid": ("H", 42),
+    "src_master_instid": ("H", 44),
+    "dst_master_instid": ("H", 46),
+    "iff": ("B", 48),
+    "buff": ("B", 49),
+    "result": ("B", 50),
+    "is_activation": ("B", 51),
+    "is_buffremove": ("B", 52),
+    "is_ninety": ("B", 53),
+    "is_fifty": ("B", 54),
+    "is_moving": ("B", 55),
+    "is_statechange": ("B", 56),
+    "is_flanking": ("B", 57),
+    "is_shields": ("B", 58),
+    "is_offcycle": ("B", 59),
+    "pad": ("I", 60),
+}
+
+OPERATORS = ("eq", "ne", "in", "lt", "le", "gt", "ge", "between")
+MAX_CACHED_RESULTS = 64
+# Masks are one byte per event, so the mask cache is bounded by size:
+# 16 MB holds 16 masks of a 1M event log and far more for typical fights
+MAX_CACHED_MASK_BYTES = 16 * 1024 * 1024
+MAX_IN_GROUPS = 16  # larger `__in` sets on multi-byte columns fall back to a C-level map
+ZERO_BYTES = bytes([1]) + bytes(255)  # translate() table: byte -> 1 if zero, also inverts a 0/1 mask
+SIGN_FLIP = bytes(byte ^ 0x80 for byte in range(256))
+
+
+def _and_masks(left: bytes, right: bytes) -> bytes:
+    """AND two 0/1 byte masks of equal length in one big-integer operation."""
+    return (int.from_bytes(left, "little") & int.from_bytes(right, "little")).to_bytes(len(left), "little")
+
+
+def _byte_lanes(values: array) -> List:
+    """
+    Split a column into byte lanes, least significant first, flipping the sign
+    bit of signed typecodes so lanes order as unsigned. A lane holding the same
+    byte for every event is returned as that int and costs nothing to compare.
+    """
+    width = values.itemsize
+    data = values.tobytes()
+    lanes = []
+    for index in range(width):
+        lane = data[index::width]
+        if index == width - 1 and values.typecode.islower():
+            lane = lane.translate(SIGN_FLIP)
+        lanes.append(lane[0] if lane and lane.count(lane[0]) == len(lane) else lane)
+    return lanes
+
+
+def _lane_bytes(values: array, value: int) -> Optional[bytes]:
+    """`value` laid out like `_byte_lanes`, or None if the column cannot hold it."""
+    try:
+        raw = value.to_bytes(values.itemsize, "little", signed=values.typecode.islower())
+    except OverflowError:
+        return None
+    if values.typecode.islower():
+        raw = raw[:-1] + bytes([raw[-1] ^ 0x80])
+    return raw
+
+
+def _ge_mask(values: array, bound: int, lanes: Optional[List] = None) -> bytes:
+    """
+    0/1 mask of values >= bound, built from the least significant lane up: a
+    value is >= where its lane byte is above the bound's byte, keeps the lower
+    lanes' result where equal, else is not. With each lane coded 0/1/2 by one
+    translate(), that step is `(codes + ge) >> 1` on whole-column big integers;
+    per-event sums stay below 4, so no carry crosses into a neighbour.
+    """
+    size = len(values)
+    if values.typecode.islower():
+        bound += 1 << (8 * values.itemsize - 1)
+    if bound <= 0:
+        return b"\x01" * size
+    if bound >= 1 << (8 * values.itemsize):
+        return bytes(size)
+    ones = int.from_bytes(b"\x01" * size, "little")
+    ge = ones
+    for lane, byte in zip(lanes or _byte_lanes(values), bound.to_bytes(values.itemsize, "little")):
+        if isinstance(lane, int):
+            if lane != byte:
+                ge = ones if lane > byte else 0
+            continue
+        codes = lane.translate(bytes(byte) + b"\x01" + b"\x02" * (255 - byte))
+        ge = ((int.from_bytes(codes, "little") + ge) >> 1) & ones
+    return ge.to_bytes(size, "little")
+
+
+def _in_mask(values: array, members: frozenset) -> bytes:
+    """
+    0/1 mask of values in `members`. Members that differ only in their lowest
+    byte form one group: its upper lanes are matched with one translate() each
+    and the low lane against every member of the group at once.
+    """
+    groups: Dict[bytes, set] = defaultdict(set)
+    for member in members:
+        raw = _lane_bytes(values, member)
+        if raw is not None:
+            groups[raw[1:]].add(raw[0])
+    if len(groups) > MAX_IN_GROUPS:
+        return bytes(map(members.__contains__, values))
+
+    size = len(values)
+    ones = int.from_bytes(b"\x01" * size, "little")
+    lanes = _byte_lanes(values)
+    found = 0
+    for upper, lows in groups.items():
+        match = ones
+        for lane, byte in zip(lanes[1:], upper):
+            if isinstance(lane, int):
+                if lane != byte:
+                    match = 0
+                    break
+            else:
+                match &= int.from_bytes(lane.translate(bytes(byte) + b"\x01" + bytes(255 - byte)), "little")
+        if not match:
+            continue
+        if isinstance(lanes[0], int):
+            match = match if lanes[0] in lows else 0
+        else:
+            match &= int.from_bytes(lanes[0].translate(bytes(int(byte in lows) for byte in range(256))), "little")
+        found |= match
+    return found.to_bytes(size, "little")
+
+
+def _column_from_records(raw: bytes, code: str, offset: int) -> array:
+    """
+    Gather one fixed-offset field from packed event records. Every field is
+    aligned to its own width, so a strided typed view copies it in one call.
+    """
+    width = array(code).itemsize
+    if width == 1:
+        return array(code, raw[offset::parser.EVENT_SIZE])
+    view = memoryview(raw).cast(code)
+    return array(code, view[offset // width::parser.EVENT_SIZE // width].tobytes())
+
+
+class _RecordColumns(dict):
+    """Column mapping that decodes each field from the raw records on first use."""
+
+    def __init__(self, raw: bytes):
+        super().__init__()
+        self.raw = raw
+
+    def __missing__(self, name: str) -> array:
+        code, offset = EVENT_COLUMNS[name]
+        column = self[name] = _column_from_records(self.raw, code, offset)
+        return column
+
+
+def _predicate_test(op: str, value):
+    """Plain callable form of a predicate, used to build byte translation tables."""
+    if op == "in":
+        return value.__contains__
+    if op == "between":
+        low, high = value
+        return lambda x: low <= x <= high
+    compare = getattr(operator, op)
+    return lambda x: compare(x, value)
+
+
+def _parse_predicate(key: str, value) -> Tuple[str, str, object]:
+    column, _, op = key.partition("__")
+    op = op or "eq"
+    if column not in EVENT_COLUMNS:
+        raise ValueError(f"Unknown event column: {column}")
+    if op not in OPERATORS:
+        raise ValueError(f"Unknown operator '{op}' for {column}, expected one of {OPERATORS}")
+    if op == "in":
+        value = frozenset(value)
+        operands = value
+    elif op == "between":
+        low, high = value
+        value = operands = (low, high)
+    else:
+        operands = (value,)
+    for operand in operands:
+        if not isinstance(operand, int):
+            raise TypeError(f"Predicate {key} compares integer column {column} with {operand!r}")
+    return column, op, value
+
+
+class EventTable:
+    """
+    Columnar copy of an event list for repeated filtering.
+
+    Each predicate compiles to a 0/1 byte mask: a translation table for 1-byte
+    columns, binary search for time on sorted logs, and per byte lane
+    translate() plus whole-column big-integer arithmetic for wider columns
+    (large `__in` sets fall back to a C-level `map`). Masks are combined with big-integer AND and
+    applied with `itertools.compress`; masks and query results are cached by
+    signature.
+    """
+
+    def __init__(self, events: List, columns: Optional[Dict[str, array]] = None, raw: Optional[bytes] = None):
+        self._events = events
+        self._raw = raw
+        if columns is None:
+            columns = {
+                name: array(code, [getattr(e, name) for e in events]) for name, (code, _) in EVENT_COLUMNS.items()
+            }
+        self.columns: Dict[str, array] = columns
+        self.size = len(raw) // parser.EVENT_SIZE if raw is not None else len(events)
+        self._masks: Dict[Tuple, bytes] = {}
+        self._results: Dict[Tuple, object] = {}
+        self._mask_bytes = 0
+
+    @classmethod
+    def from_evtc(cls, file_path: str) -> "EventTable":
+        """
+        Build the columns straight from the event section of a log without
+        creating EvtcEvent objects; `EventQuery.events()` decodes matches lazily.
+        """
+        layout = parser.validate_evtc(file_path)
+        with open(file_path, "rb") as f:
+            f.seek(layout.events_offset)
+            return cls.from_records(f.read(layout.event_count * parser.EVENT_SIZE))
+
+    @classmethod
+    def from_records(cls, raw: bytes) -> "EventTable":
+        """Build the columns from packed event records, e.g. `parse_evtc(..., raw_events=True)`."""
+        return cls(None, _RecordColumns(raw), raw)
+
+    def __len__(self) -> int:
+        return self.size
+
+    @cached_property
+    def time_sorted(self) -> bool:
+        times = self.columns["time"]
+        return all(map(operator.le, times, islice(times, 1, None)))
+
+    @property
+    def events(self) -> List:
+        if self._events is None:
+            self._events = [parser.EvtcEvent(*fields) for fields in struct.iter_unpack(parser.EVENT_STRUCT, self._raw)]
+        return self._events
+
+    def where(self, **predicates) -> "EventQuery":
+        """Select events matching all predicates, e.g. `skill_id__in=[...]`, `time__between=(a, b)`."""
+        return EventQuery(self, ()).where(**predicates)
+
+    def _cache(self, cache: Dict, key: Tuple, value):
+        if len(cache) >= MAX_CACHED_RESULTS:
+            del cache[next(iter(cache))]
+        cache[key] = value
+        return value
+
+    def _cache_mask(self, key: Tuple, mask: bytes) -> bytes:
+        """Cache a mask, evicting the oldest ones to stay within MAX_CACHED_MASK_BYTES."""
+        while self._masks and self._mask_bytes + len(mask) > MAX_CACHED_MASK_BYTES:
+            self._mask_bytes -= len(self._masks.pop(next(iter(self._masks))))
+        if len(mask) <= MAX_CACHED_MASK_BYTES:
+            self._masks[key] = mask
+            self._mask_bytes += len(mask)
+        return mask
+
+    def _predicate_mask(self, column: str, op: str, value) -> bytes:
+        key = (column, op, value)
+        mask = self._masks.get(key)
+        if mask is not None:
+            return mask
+
+        values = self.columns[column]
+        if op == "between" and column == "time" and self.time_sorted:
+            lo = bisect_left(values, value[0])
+            hi = bisect_right(values, value[1])
+            mask = bytes(lo) + b"\x01" * max(hi - lo, 0) + bytes(self.size - max(hi, lo))
+        elif values.typecode == "B":
+            test = _predicate_test(op, value)
+            mask = values.tobytes().translate(bytes(int(bool(test(x))) for x in range(256)))
+        elif op in ("eq", "ne", "in"):
+            mask = _in_mask(values, value if op == "in" else frozenset((value,)))
+            if op == "ne":
+                mask = mask.translate(ZERO_BYTES)
+        elif op == "between":
+            low, high = value
+            lanes = _byte_lanes(values)
+            mask = _and_masks(_ge_mask(values, low, lanes), _ge_mask(values, high + 1, lanes).translate(ZERO_BYTES))
+        else:
+            bound = value + 1 if op in ("gt", "le") else value
+            mask = _ge_mask(values, bound)
+            if op in ("lt", "le"):
+                mask = mask.translate(ZERO_BYTES)
+        return self._cache_mask(key, mask)
+
+    def mask(self, signature: Tuple) -> bytes:
+        """Combined mask for a sorted tuple of (column, op, value) predicates."""
+        mask = self._masks.get(signature)
+        if mask is not None:
+            return mask
+        mask = b"\x01" * self.size
+        for column, op, value in signature:
+            mask = _and_masks(mask, self._predicate_mask(column, op, value))
+        return self._cache_mask(signature, mask)
+
+
+class EventQuery:
+    """A filtered view of an EventTable; chaining `where` narrows it further."""
+
+    def __init__(self, table: EventTable, signature: Tuple):
+        self.table = table
+        self.signature = signature
+
+    def where(self, **predicates) -> "EventQuery":
+        parsed = {_parse_predicate(key, value) for key, value in predicates.items()}
+        signature = tuple(sorted(set(self.signature) | parsed, key=lambda p: (p[0], p[1], repr(p[2]))))
+        return EventQuery(self.table, signature)
+
+    def mask(self) -> bytes:
+        return self.table.mask(self.signature)
+
+    def count(self) -> int:
+        return self.mask().count(1)
+
+    def column(self, name: str) -> List:
+        """Values of one column for the selected events."""
+        return list(compress(self.table.columns[name], self.mask()))
+
+    def events(self) -> List:
+        """The selected EvtcEvent objects."""
+        table = self.table
+        if table._events is None:
+            size = parser.EVENT_SIZE
+            return [
+                parser.EvtcEvent(*struct.unpack_from(parser.EVENT_STRUCT, table._raw, index * size))
+                for index in compress(range(table.size), self.mask())
+            ]
+        return list(compress(table.events, self.mask()))
+
+    def sum(self, name: str) -> int:
+        return sum(compress(self.table.columns[name], self.mask()))
+
+    def first_values(self, key: str, value: str, wanted: Optional[set] = None, chunk: int = 65536) -> Dict[int, int]:
+        """
+        Map each distinct `key` to `value` at its first selected event. Scans in
+        chunks and stops early once every key in `wanted` has been seen.
+        """
+        table = self.table
+        keys, values, mask = table.columns[key], table.columns[value], self.mask()
+        found: Dict[int, int] = {}
+        for lo in range(0, table.size, chunk):
+            hi = lo + chunk
+            chunk_keys = list(compress(keys[lo:hi], mask[lo:hi]))
+            chunk_values = list(compress(values[lo:hi], mask[lo:hi]))
+            # Reversed so the earliest event per key is the one left in the dict
+            first = dict(zip(reversed(chunk_keys), reversed(chunk_values)))
+            first.update(found)
+            found = first
+            if wanted is not None and wanted.issubset(found):
+                break
+        return found
+
+    def group_by(self, key: str) -> "GroupedQuery":
+        if key not in EVENT_COLUMNS:
+            raise ValueError(f"Unknown event column: {key}")
+        return GroupedQuery(self, key)
+
+
+class GroupedQuery:
+    def __init__(self, query: EventQuery, key: str):
+        self.query = query
+        self.key = key
+
+    def _aggregate(self, name: str, values: Iterable) -> Dict[int, int]:
+        result_key = (self.query.signature, self.key, name)
+        table = self.query.table
+        cached = table._results.get(result_key)
+        if cached is not None:
+            return dict(cached)
+        totals: Dict[int, int] = defaultdict(int)
+        for group, amount in zip(compress(table.columns[self.key], self.query.mask()), values):
+            totals[group] += amount
+        return dict(table._cache(table._results, result_key, dict(totals)))
+
+    def sum(self, name: str) -> Dict[int, int]:
+        """Total of column `name` per group."""
+        if name not in EVENT_COLUMNS:
+            raise ValueError(f"Unknown event column: {name}")
+        return self._aggregate(name, compress(self.query.table.columns[name], self.query.mask()))
+
+    def count(self) -> Dict[int, int]:
+        """Number of selected events per group."""
+        return self._aggregate("__count__", repeat(1))
@@ -2,16 +2,16 @@ import configparser
 import datetime
 import logging
 import os
-import queue
 import threading
-import tempfile
 import time
 import zipfile
 from collections import defaultdict, Counter
+from dataclasses import dataclass
 from typing import Dict, List, Optional, Tuple
 
 import requests
 import parser
+import query
 import gw2_data
 from watchdog.events import FileSystemEventHandler
 from watchdog.observers.polling import PollingObserver
@@ -26,11 +26,119 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-MAX_WAIT_TIME = 45  # seconds to wait for file completion
-LOG_QUEUE = queue.Queue()
+CHECK_INTERVAL = 0.5  # seconds between stability checks of a queued file
+STABLE_CHECKS = 4  # consecutive unchanged checks before a file counts as complete
+BASE_WAIT_TIME = 100  # seconds a file may keep changing before it is dropped
+STALE_LOG_SECONDS = 900  # logs last written longer ago than this are backlog
 PROCESSED = set()   # deduplication guard
 
 
+# --- Log scheduling ---
+@dataclass
+class QueuedLog:
+    path: str
+    queued_at: float  # wall clock of the first file event
+    modified_at: float  # file mtime, newest runs first
+    max_wait: float = BASE_WAIT_TIME
+    monitor_started: float = 0.0  # wall clock of the first stability check
+    last_size: int = -1
+    last_mtime: float = 0.0
+    stable_count: int = 0
+    not_before: float = 0.0  # monotonic time of the next stability check
+
+
+class LogScheduler:
+    """
+    Queue of logs waiting to be processed, newest fight first.
+
+    Repeated file events for a queued path merge into one entry. A file that is
+    still being written is rescheduled rather than waited on, so it never holds
+    up smaller logs behind it. Logs whose mtime is older than `stale_after`
+    run after all fresh logs, or are dropped when `skip_stale` is set.
+    """
+
+    def __init__(self, stale_after: float = STALE_LOG_SECONDS, skip_stale: bool = False):
+        self.stale_after = stale_after
+        self.skip_stale = skip_stale
+        self._entries: Dict[str, QueuedLog] = {}
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def put(self, file_path: str) -> bool:
+        """Queue a log, or merge into its queued entry. Returns False if it was already processed."""
+        try:
+            modified_at = os.path.getmtime(file_path)
+        except OSError:
+            modified_at = time.time()
+        with self._cond:
+            if file_path in PROCESSED:
+                return False
+            entry = self._entries.get(file_path)
+            if entry:
+                entry.modified_at = max(entry.modified_at, modified_at)
+            else:
+                self._entries[file_path] = QueuedLog(file_path, time.time(), modified_at)
+            self._cond.notify()
+            return True
+
+    def reschedule(self, entry: QueuedLog, delay: float = CHECK_INTERVAL) -> None:
+        """Return an entry popped by `get` to the queue for another check after `delay`."""
+        entry.not_before = time.monotonic() + delay
+        with self._cond:
+            if entry.path in PROCESSED:
+                return
+            merged = self._entries.get(entry.path)
+            if merged:
+                entry.modified_at = max(entry.modified_at, merged.modified_at)
+            self._entries[entry.path] = entry
+            self._cond.notify()
+
+    def mark_processed(self, file_path: str) -> bool:
+        """
+        Record a log as handled and drop any entry queued for it while it was
+        being checked. Returns False if another worker already claimed it.
+        """
+        with self._cond:
+            if file_path in PROCESSED:
+                return False
+            PROCESSED.add(file_path)
+            self._entries.pop(file_path, None)
+            return True
+
+    def is_stale(self, entry: QueuedLog) -> bool:
+        return time.time() - entry.modified_at > self.stale_after
+
+    def get(self) -> Optional[QueuedLog]:
+        """Block until an entry is due and return the most urgent one; None after `close`."""
+        with self._cond:
+            while True:
+                if self._closed:
+                    return None
+                now = time.monotonic()
+                for entry in [e for e in self._entries.values() if self.skip_stale and self.is_stale(e)]:
+                    del self._entries[entry.path]
+                    PROCESSED.add(entry.path)
+                    logger.info("Skipping stale log %s", entry.path)
+                due = [e for e in self._entries.values() if e.not_before <= now]
+                if due:
+                    entry = min(due, key=lambda e: (self.is_stale(e), -e.modified_at))
+                    return self._entries.pop(entry.path)
+                next_due = min((e.not_before for e in self._entries.values()), default=None)
+                self._cond.wait(None if next_due is None else next_due - now)
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def qsize(self) -> int:
+        with self._cond:
+            return len(self._entries)
+
+
+LOG_QUEUE = LogScheduler()
+
+
 # --- File event handler ---
 class MyHandler(FileSystemEventHandler):
     def on_created(self, event): 
@@ -48,9 +156,7 @@ class MyHandler(FileSystemEventHandler):
 
     def handle_file_event(self, file_path):
         if file_path.endswith((".evtc", ".zevtc")):
-            if file_path not in PROCESSED:  # prevent duplicates
-                LOG_QUEUE.put(file_path)
-                PROCESSED.add(file_path)                
+            if LOG_QUEUE.put(file_path):  # False for already processed logs
                 logger.info(
                     "Queued file for processing: %s (queue size: %d)",
                     file_path,
@@ -61,29 +167,47 @@ class MyHandler(FileSystemEventHandler):
 # --- Worker thread ---
 def log_worker():
     while True:
-        log_file = LOG_QUEUE.get()  # blocking wait
-        if log_file is None:  # shutdown signal
+        entry = LOG_QUEUE.get()  # blocking wait
+        if entry is None:  # shutdown signal
             break
 
+        try:
+            if not check_file_completion(entry):
+                continue
+        except Exception as e:
+            logger.exception("Error checking %s: %s", entry.path, e)
+            continue
+
+        if not LOG_QUEUE.mark_processed(entry.path):
+            continue
         start_time = datetime.datetime.now()
-        _, file_ext = os.path.splitext(log_file)
+        queue_wait = time.time() - entry.queued_at
+        logger.info(
+            "Dequeued %s after %.2fs%s",
+            entry.path,
+            queue_wait,
+            " (stale backlog)" if LOG_QUEUE.is_stale(entry) else "",
+        )
+        _, file_ext = os.path.splitext(entry.path)
 
         try:
-            wait_for_file_completion(log_file, file_ext, start_time)
+            process_new_log(entry.path, file_ext, start_time)
         except Exception as e:
-            logger.exception("Error handling %s: %s", log_file, e)
+            logger.exception("Error handling %s: %s", entry.path, e)
 
-        LOG_QUEUE.task_done()
         logger.info(
-            "Finished processing %s (queue size: %d)",
-            log_file,
+            "Finished processing %s: %.2fs from first file event (queue size: %d)",
+            entry.path,
+            time.time() - entry.queued_at,
             LOG_QUEUE.qsize(),
         )
 
 
-def wait_for_file_completion(file_path: str, file_ext: str, start_time: float) -> None:
+def check_file_completion(entry: QueuedLog) -> bool:
     """
-    Waits until a newly created log file stops changing before processing it.
+    Run one stability check on a queued log. Returns True once the file has
+    stopped changing; otherwise reschedules the entry (or drops it on timeout)
+    and returns False so the worker can move on to other logs.
     """
 
     # Dynamic scaling based on file size
@@ -91,66 +215,70 @@ def wait_for_file_completion(file_path: str, file_ext: str, start_time: float) -
         size_factor = 1 + (size_bytes // 5_000_000)
         return size_factor * 60 + 60  # seconds
 
-    # Initial parameters
-    check_interval = 0.5  # check every 500 ms
-    last_modified = 0
-    stable_count = 0
-    max_retries = 200  
-
-    # Track dynamic wait time extension for large files
-    base_wait_time = 100  # seconds
-    last_size = 0
-
-    logger.info("Monitoring %s for completion...", file_path)
+    # Time spent queued behind other logs does not count towards the timeout
+    if not entry.monitor_started:
+        entry.monitor_started = time.time()
 
-    # Check for existence first
-    while not os.path.exists(file_path):
-        time.sleep(1)
-        logger.debug("Waiting for file to appear: %s", file_path)
-
-    # Determine an adaptive maximum wait time
     try:
-        size_now = os.path.getsize(file_path)
-        max_wait_time = max(base_wait_time, estimate_wait_time(size_now))
-    except Exception:
-        max_wait_time = base_wait_time
+        if not os.path.exists(entry.path):
+            if entry.last_size > 0 or time.time() - entry.monitor_started > entry.max_wait:
+                logger.warning("File disappeared before completion: %s", entry.path)
+                LOG_QUEUE.mark_processed(entry.path)
+                return False
+            logger.debug("Waiting for file to appear: %s", entry.path)
+            LOG_QUEUE.reschedule(entry, 1)
+            return False
+
+        current_mod = os.path.getmtime(entry.path)
+        current_size = os.path.getsize(entry.path)
+        if entry.last_size < 0:
+            logger.info("Monitoring %s for completion...", entry.path)
+            entry.max_wait = max(BASE_WAIT_TIME, estimate_wait_time(current_size))
+
+        # Check if file has stabilized
+        if current_mod == entry.last_mtime and current_size == entry.last_size and current_size > 0:
+            entry.stable_count += 1
+            if entry.stable_count >= STABLE_CHECKS:  # stable for 2.0s
+                logger.info("File appears complete: %s", entry.path)
+                return True
+        elif time.time() - entry.monitor_started > entry.max_wait:
+            logger.warning("Timeout waiting for %s to become stable.", entry.path)
+            LOG_QUEUE.mark_processed(entry.path)
+            return False
+        else:
+            entry.stable_count = 0
+            entry.last_mtime = current_mod
+            entry.last_size = current_size
 
-    start_wait = time.time()
-    while time.time() - start_wait < max_wait_time:
-        try:
-            if not os.path.exists(file_path):
-                logger.warning("File disappeared before completion: %s", file_path)
-                return
+    except (OSError, PermissionError):
+        if time.time() - entry.monitor_started > entry.max_wait:
+            logger.warning("Timeout waiting for %s to become accessible.", entry.path)
+            LOG_QUEUE.mark_processed(entry.path)
+            return False
+        logger.debug("File %s not yet accessible, waiting...", entry.path)
 
-            current_mod = os.path.getmtime(file_path)
-            current_size = os.path.getsize(file_path)
+    LOG_QUEUE.reschedule(entry)
+    return False
 
-            # Check if file has stabilized
-            if current_mod == last_modified and current_size == last_size and current_size > 0:
-                stable_count += 1
-                if stable_count >= 4:  #43 consecutive stable checks = stable for 2.0s
-                    logger.info("File appears complete: %s", file_path)
-                    process_new_log(file_path, file_ext, start_time)
-                    return
-            else:
-                stable_count = 0
-                last_modified = current_mod
-                last_size = current_size
 
-        except (OSError, PermissionError):
-            logger.debug("File %s not yet accessible, waiting...", file_path)
+# --- Agent utilities ---
+# Profession names indexed by id, so lookups are list indexing rather than dict gets
+ELITE_NAMES = [gw2_data.elites.get(elite_id) for elite_id in range(max(gw2_data.elites) + 1)]
+PROF_NAMES = [gw2_data.profs.get(prof_id) for prof_id in range(max(gw2_data.profs) + 1)]
 
-        time.sleep(check_interval)
 
-    logger.warning("Timeout waiting for %s to become stable.", file_path)
+def agent_profession(agent) -> Optional[str]:
+    """Elite spec name if known, otherwise the core profession name."""
+    if agent.is_elite < len(ELITE_NAMES) and ELITE_NAMES[agent.is_elite]:
+        return ELITE_NAMES[agent.is_elite]
+    return PROF_NAMES[agent.profession] if agent.profession < len(PROF_NAMES) else None
 
 
-# --- Agent utilities ---
-def set_team_changes(agents: List, events: List) -> None:
+def set_team_changes(agents: List, events: query.EventTable) -> None:
     """Assign teams to agents based on event statechanges."""
     team_assignments: Dict[int, int] = {}
-    for event in events:
-        if event.is_statechange == 22 and event.src_agent:
+    for event in events.where(is_statechange=22).events():
+        if event.src_agent:
             assigned_team = event.dst_agent if event.dst_agent else event.value
             if assigned_team != 0:
                 team_assignments[event.src_agent] = assigned_team
@@ -162,19 +290,16 @@ def set_team_changes(agents: List, events: List) -> None:
                 agent.team = gw2_data.team_ids[assigned_team]
 
 
-def set_agent_instance_id(agents: List, events: List) -> None:
+def set_agent_instance_id(agents: List, events: query.EventTable) -> None:
     """Assign first seen instance IDs to agents."""
-    instance_ids: Dict[int, int] = {}
-    for event in events:
-        if event.is_statechange != 22 and event.src_instid and event.src_agent:
-            if event.src_agent not in instance_ids:
-                instance_ids[event.src_agent] = event.src_instid
+    pending = [agent for agent in agents if agent.is_elite != 4294967295 and not agent.instid and agent.address]
+    seen = events.where(is_statechange__ne=22, src_instid__ne=0)
+    instance_ids = seen.first_values("src_agent", "src_instid", {agent.address for agent in pending})
 
-    for agent in agents:
-        if agent.is_elite != 4294967295 and not agent.instid:
-            instid = instance_ids.get(agent.address)
-            if instid:
-                agent.instid = instid
+    for agent in pending:
+        instid = instance_ids.get(agent.address)
+        if instid:
+            agent.instid = instid
 
 
 def summarize_non_squad_players(
@@ -199,18 +324,12 @@ def summarize_non_squad_players(
             if agent.instid not in squad_id:
                 squad_id.add(agent.instid)
                 squad_count += 1
-                agent_prof = gw2_data.elites.get(
-                    agent.is_elite, gw2_data.profs[agent.profession]
-                )
-                squad_comp["Squad"][agent_prof] += 1
+                squad_comp["Squad"][agent_profession(agent)] += 1
             if squad_color is None:
                 squad_color = agent.team
         elif agent.instid not in duplicate_check:
             duplicate_check.add(agent.instid)
-            agent_prof = gw2_data.elites.get(
-                agent.is_elite, gw2_data.profs[agent.profession]
-            )
-            non_squad_summary[agent.team][agent_prof] += 1
+            non_squad_summary[agent.team][agent_profession(agent)] += 1
 
     return squad_count, non_squad_summary, squad_comp, squad_color
 
@@ -281,6 +400,61 @@ def send_to_discord(
         logger.error("Error sending to Discord: %s", e)
 
 # --- Log processing ---
+def summarize_log(
+    agents: List, events: query.EventTable
+) -> Tuple[int, Dict[int, Counter], Dict[str, Counter], Optional[int]]:
+    """Resolve teams and instance IDs, then summarize squad and non-squad players."""
+    resolve_start = time.perf_counter()
+    logger.info("Setting team changes for %d agents", len(agents))
+    set_team_changes(agents, events)
+
+    logger.info("Setting agent instance IDs")
+    set_agent_instance_id(agents, events)
+
+    logger.info("Summarizing non-squad players")
+    squad_count, team_report, squad_comp, squad_color = summarize_non_squad_players(agents)
+    logger.info("Squad players: %d", squad_count)
+    logger.info("Agent resolution took %.1f ms", (time.perf_counter() - resolve_start) * 1000)
+    return squad_count, team_report, squad_comp, squad_color
+
+
+def publish_summary(
+    webhook_url: Optional[str],
+    log_file: str,
+    squad_count: int,
+    team_report: Dict,
+    squad_comp: Dict,
+    squad_color: Optional[int],
+) -> None:
+    """Send the summary to Discord, or print it when no webhook is configured."""
+    if webhook_url:
+        logger.info("Sending to Discord webhook: %s", webhook_url)
+        send_to_discord(webhook_url, log_file, team_report, squad_count, squad_comp, squad_color)
+    else:
+        logger.warning("No WEBHOOK_URL configured, skipping Discord send")
+        print("\n===== Log Summary =====")
+        print(f"File: {os.path.basename(log_file)}")
+        print(f"Squad members: {squad_count}")
+        print("Squad composition:")
+        squad_comp_line = ""
+        for prof, count in squad_comp["Squad"].items():
+            squad_comp_line += f"{gw2_data.prof_abbrv[prof]}: {count}, "
+        print(f"  {squad_comp_line.rstrip(', ')}")
+
+        if not team_report:
+            print("No non-squad players found.")
+        else:
+            for team, counter in team_report.items():
+                team_count = sum(counter.values())
+                team_name = "Allies" if team == squad_color else f"Team {team}"
+                print(f"\n{team_name} ({team_count} players):")
+                prof_count_line = ""
+                for prof, count in counter.items():
+                    prof_count_line += f"{gw2_data.prof_abbrv[prof]}: {count}, "
+                print(f"  {team_name} Comp: {prof_count_line.rstrip(', ')}")
+        print("========================\n")
+
+
 def process_new_log(log_file: str, file_ext: str, start_time: datetime.datetime) -> None:
     logger.info("Starting processing of %s", log_file)
     agents, skills, events, header = [], [], [], None
@@ -288,28 +462,14 @@ def process_new_log(log_file: str, file_ext: str, start_time: datetime.datetime)
     try:
         if file_ext.lower() == ".zevtc":
             logger.info("Processing .zevtc file: %s", log_file)
-            with tempfile.TemporaryDirectory() as temp_dir:
-                with zipfile.ZipFile(log_file, "r") as zip_ref:
-                    zip_ref.extractall(temp_dir)
-                for extracted_file in os.listdir(temp_dir):
-                    extracted_path = os.path.join(temp_dir, extracted_file)
-                    logger.debug("Extracted file: %s", extracted_path)
-                    last_size = -1
-                    start_wait = time.time()
-                    while time.time() - start_wait < MAX_WAIT_TIME:
-                        try:
-                            current_size = os.path.getsize(extracted_path)
-                            if current_size == last_size and current_size > 0:
-                                logger.info("Parsing extracted file: %s", extracted_path)
-                                header, agents, skills, events = parser.parse_evtc(extracted_path)
-                                break
-                            last_size = current_size
-                        except (IOError, PermissionError):
-                            logger.debug("File %s not yet accessible", extracted_path)
-                        time.sleep(1)
-                    else:
-                        logger.warning("Timeout waiting for %s to complete.", extracted_path)
-                        return
+            # The archive is complete once the file is stable, so read the
+            # member straight into the parser instead of extracting to disk
+            with zipfile.ZipFile(log_file, "r") as zip_ref:
+                member = zip_ref.namelist()[0]
+                logger.info("Parsing archived file: %s", member)
+                header, agents, skills, events = parser.parse_evtc_bytes(
+                    zip_ref.read(member), recover=True, raw_events=True
+                )
 
         elif file_ext.lower() == ".evtc":
             logger.info("Processing .evtc file: %s", log_file)
@@ -321,11 +481,11 @@ def process_new_log(log_file: str, file_ext: str, start_time: datetime.datetime)
                 if not header_bytes.startswith(b"EVTC"):
                     logger.error("Error: %s is not a valid EVTC file", log_file)
                     return
-            header, agents, skills, events = parser.parse_evtc(log_file)
+            header, agents, skills, events = parser.parse_evtc(log_file, recover=True, raw_events=True)
             if not all([header, agents, skills, events]):
                 logger.error("Error: Incomplete data from parser for %s", log_file)
                 return
-            logger.info("Parsed %s: %d agents, %d skills, %d events", log_file, len(agents), len(skills), len(events))
+            logger.info("Parsed %s: %d agents, %d skills, %d events", log_file, len(agents), len(skills), len(events) // parser.EVENT_SIZE)
 
     except zipfile.BadZipFile as e:
         logger.error("Failed to extract %s: %s", log_file, e)
@@ -334,46 +494,18 @@ def process_new_log(log_file: str, file_ext: str, start_time: datetime.datetime)
         logger.exception("Error processing %s: %s", log_file, e)
         return
 
-    logger.info("Setting team changes for %d agents", len(agents))
-    set_team_changes(agents, events)
-
-    logger.info("Setting agent instance IDs")
-    set_agent_instance_id(agents, events)
+    events = query.EventTable.from_records(events)
+    if header is not None and header.truncated:
+        logger.warning("%s is truncated, summarizing %d complete events", log_file, len(events))
 
-    logger.info("Summarizing non-squad players")
-    squad_count, team_report, squad_comp, squad_color = summarize_non_squad_players(agents)
-    logger.info("Squad players: %d", squad_count)
+    squad_count, team_report, squad_comp, squad_color = summarize_log(agents, events)
 
     end_time = datetime.datetime.now()
     logger.info("File %s processed, %d agents, %d skills, %d events", log_file, len(agents), len(skills), len(events))
     logger.info("Processing Time: %s", end_time - start_time)
+    logger.debug("Intern cache: %s", parser.intern_cache_info())
 
-    if WEBHOOK_URL:
-        logger.info("Sending to Discord webhook: %s", WEBHOOK_URL)
-        send_to_discord(WEBHOOK_URL, log_file, team_report, squad_count, squad_comp, squad_color)
-    else:
-        logger.warning("No WEBHOOK_URL configured, skipping Discord send")
-        print("\n===== Log Summary =====")
-        print(f"File: {os.path.basename(log_file)}")
-        print(f"Squad members: {squad_count}")
-        print("Squad composition:")
-        squad_comp_line = ""
-        for prof, count in squad_comp["Squad"].items():
-            squad_comp_line += f"{gw2_data.prof_abbrv[prof]}: {count}, "
-        print(f"  {squad_comp_line.rstrip(', ')}")
-
-        if not team_report:
-            print("No non-squad players found.")
-        else:
-            for team, counter in team_report.items():
-                team_count = sum(counter.values())
-                team_name = "Allies" if team == squad_color else f"Team {team}"
-                print(f"\n{team_name} ({team_count} players):")
-                prof_count_line = ""
-                for prof, count in counter.items():
-                    prof_count_line += f"{gw2_data.prof_abbrv[prof]}: {count}, "
-                print(f"  {team_name} Comp: {prof_count_line.rstrip(', ')}")
-        print("========================\n")
+    publish_summary(WEBHOOK_URL, log_file, squad_count, team_report, squad_comp, squad_color)
 
     parser.free_evtc_data(header, agents, skills, events)
 
@@ -391,10 +523,14 @@ if __name__ == "__main__":
 
     LOG_DELAY = int(config_ini["Settings"].get("LOG_DELAY", 5))
     WEBHOOK_URL = config_ini["Settings"]["WEBHOOK_URL"]
+    LOG_QUEUE.stale_after = int(config_ini["Settings"].get("STALE_LOG_SECONDS", STALE_LOG_SECONDS))
+    LOG_QUEUE.skip_stale = config_ini["Settings"].getboolean("SKIP_STALE_LOGS", False)
+    LOG_WORKERS = int(config_ini["Settings"].get("LOG_WORKERS", 2))
 
-    # Start worker thread
-    worker = threading.Thread(target=log_worker, daemon=True)
-    worker.start()
+    # Start worker threads
+    workers = [threading.Thread(target=log_worker, daemon=True) for _ in range(LOG_WORKERS)]
+    for worker in workers:
+        worker.start()
 
     logger.info("Watching for new ArcDps logs in %s", ARCDPS_LOG_DIR)
     event_handler = MyHandler()
@@ -406,7 +542,8 @@ if __name__ == "__main__":
             time.sleep(1)
     except KeyboardInterrupt:
         observer.stop()
-        LOG_QUEUE.put(None)  # signal worker to stop
-        worker.join()
+        LOG_QUEUE.close()  # signal workers to stop
+        for worker in workers:
+            worker.join()
 
     observer.join()
\ No newline at end of file